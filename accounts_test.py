@@ -1,4 +1,6 @@
-import json
+import sys
+
+import orjson
 from google.analytics.admin import AnalyticsAdminServiceClient
 
 def main():
@@ -9,22 +11,23 @@ def main():
         account_entry = {
             "account": summary.account,
             "displayName": summary.display_name,
-            "properties": []
-        }
-
-        for prop_summary in summary.property_summaries:
-            prop_id = prop_summary.property.split("/")[-1]
-            account_entry["properties"].append(
+            "properties": [
                 {
                     "property": prop_summary.property,
-                    "propertyId": prop_id,
+                    "propertyId": prop_summary.property.rpartition("/")[2],
                     "displayName": prop_summary.display_name,
                 }
-            )
+                for prop_summary in summary.property_summaries
+            ]
+        }
 
         accounts_data.append(account_entry)
 
-    print(json.dumps({"accounts": accounts_data}, indent=2))
+    output = orjson.dumps(
+        {"accounts": accounts_data},
+        option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE,
+    )
+    sys.stdout.buffer.write(output)
 
 if __name__ == "__main__":
     main()
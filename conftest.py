@@ -0,0 +1,3 @@
+# accounts_test.py and sessions_test.py are manual CLI scripts that call the
+# live GA APIs, not pytest modules.
+collect_ignore = ["accounts_test.py", "sessions_test.py"]
@@ -0,0 +1,437 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import hashlib
+import itertools
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Iterator, List, Optional, Tuple, Union
+
+import orjson
+from cachetools import TTLCache
+
+# google.analytics.* registers its protobuf descriptors on import, which takes
+# a few hundred ms on a cold start. The Google modules are imported where they
+# are first used, so a CORS preflight returns without loading any of them.
+if TYPE_CHECKING:
+    from google.analytics.admin import AnalyticsAdminServiceAsyncClient
+    from google.analytics.data_v1beta import BetaAnalyticsDataAsyncClient, BetaAnalyticsDataClient
+    from google.analytics.data_v1beta.types import RunReportRequest
+    from google.oauth2.credentials import Credentials
+
+
+# ----------------------------
+# Event loop
+# ----------------------------
+# One loop per process, running in a daemon thread. Async gRPC channels are
+# bound to the loop that created them, so cached clients stay usable only if
+# every request runs its GA calls on this same loop. Handlers stay synchronous
+# (Flask) and hand their coroutines over with _run().
+#
+# The loop is started on first use, not at import: gunicorn imports main in
+# its master and then forks the workers, and the loop thread would not survive
+# the fork. _reset_after_fork() also drops whatever a parent had started.
+_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_LOOP_LOCK = threading.Lock()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _LOOP
+    loop = _LOOP
+    if loop is None:
+        with _LOOP_LOCK:
+            loop = _LOOP
+            if loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, daemon=True).start()
+                _LOOP = loop
+    return loop
+
+
+def _run(coro):
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
+
+
+# ----------------------------
+# Client cache
+# ----------------------------
+# Access tokens live ~60 minutes, so cached clients are dropped a bit earlier.
+# Reusing a client keeps its gRPC channel (and TLS session) warm across the
+# invocations served by the same instance. Each entry holds open connections,
+# so the caches are also bounded in size and evicted clients are closed. The
+# gRPC client caches are only touched from coroutines on the loop, so they need
+# no locking.
+_CLIENT_TTL_SECONDS = 50 * 60
+_CLIENT_CACHE_SIZE = 128
+
+# Evicted clients are closed after a grace period, so a call that picked one
+# up just before it was evicted can still finish on it.
+_CLIENT_CLOSE_DELAY_SECONDS = 60
+
+
+def _close_later(transport) -> None:
+    def close():
+        result = transport.close()
+        # gRPC asyncio transports return a coroutine, REST ones close at once.
+        if asyncio.iscoroutine(result):
+            asyncio.ensure_future(result)
+
+    loop = _get_loop()
+    loop.call_soon_threadsafe(loop.call_later, _CLIENT_CLOSE_DELAY_SECONDS, close)
+
+
+class _ClientCache(TTLCache):
+    """
+    TTL + LRU cache of (clients, round-robin iterator) entries that closes the
+    clients' transports when an entry expires or is evicted for space.
+    """
+
+    def __init__(self, maxsize=_CLIENT_CACHE_SIZE, ttl=_CLIENT_TTL_SECONDS, timer=time.monotonic):
+        super().__init__(maxsize=maxsize, ttl=ttl, timer=timer)
+
+    @staticmethod
+    def _close(entry) -> None:
+        clients, _ = entry
+        for client in clients:
+            _close_later(client.transport)
+
+    def popitem(self):
+        key, entry = super().popitem()
+        self._close(entry)
+        return key, entry
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        for _, entry in expired:
+            self._close(entry)
+        return expired
+
+
+_ADMIN_CLIENTS = _ClientCache()
+_DATA_CLIENTS = _ClientCache()
+
+# Single-property reports go over REST instead: one small request does not
+# need an HTTP/2 channel, and the client's requests session keeps its
+# connection pooled between calls. This cache is used from the request
+# threads, so it has a lock.
+_REST_DATA_CLIENTS = _ClientCache()
+_REST_DATA_CLIENTS_LOCK = threading.Lock()
+
+# Data API clients are pooled over several gRPC channels. A local subchannel
+# pool gives every channel its own TCP connection, so concurrent run_report
+# calls are not serialised behind one HTTP/2 connection's flow control.
+_DATA_CHANNEL_POOL_SIZE = 4
+
+# Keepalive pings stop Google's front ends from closing idle HTTP/2
+# connections between bursts, so a warm instance reuses its connections
+# instead of paying a new TCP + TLS handshake.
+_KEEPALIVE_OPTIONS = [
+    ("grpc.keepalive_time_ms", 30000),
+    ("grpc.keepalive_timeout_ms", 10000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+    ("grpc.http2.min_time_between_pings_ms", 10000),
+]
+_DATA_CHANNEL_OPTIONS = [("grpc.use_local_subchannel_pool", 1), *_KEEPALIVE_OPTIONS]
+
+# Upper bound on multi-property report calls in flight on this instance,
+# shared by all concurrent HTTP requests so a burst of dashboards cannot open
+# an unbounded number of Data API calls at once.
+_MAX_CONCURRENT_REPORTS = 8
+_REPORT_SEMAPHORE: Optional[asyncio.Semaphore] = None
+
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _cached_client(cache: _ClientCache, factory, creds: Credentials, token: str):
+    # factory returns a list of clients; callers get them round-robin.
+    key = _token_key(token)
+    entry = cache.get(key)
+    if entry is None:
+        clients = factory(credentials=creds)
+        entry = (clients, itertools.cycle(clients))
+        cache[key] = entry
+    return next(entry[1])
+
+
+# The factories below run on the shared loop the first time a token is seen.
+# A cold google.analytics.* import there would stall every other request's GA
+# calls, so the entry points import the modules on the request thread first.
+def _import_admin_api() -> None:
+    import google.analytics.admin  # noqa: F401
+    import google.analytics.admin_v1alpha.services.analytics_admin_service.transports  # noqa: F401
+
+
+def _import_data_api() -> None:
+    import google.analytics.data_v1beta  # noqa: F401
+    import google.analytics.data_v1beta.services.beta_analytics_data.transports  # noqa: F401
+
+
+def _new_admin_client(credentials: Credentials) -> List[AnalyticsAdminServiceAsyncClient]:
+    from google.analytics.admin import AnalyticsAdminServiceAsyncClient
+    from google.analytics.admin_v1alpha.services.analytics_admin_service.transports import (
+        AnalyticsAdminServiceGrpcAsyncIOTransport,
+    )
+
+    channel = AnalyticsAdminServiceGrpcAsyncIOTransport.create_channel(
+        credentials=credentials,
+        options=_KEEPALIVE_OPTIONS,
+    )
+    transport = AnalyticsAdminServiceGrpcAsyncIOTransport(channel=channel)
+    return [AnalyticsAdminServiceAsyncClient(transport=transport)]
+
+
+def _get_admin_client(creds: Credentials, token: str) -> AnalyticsAdminServiceAsyncClient:
+    return _cached_client(_ADMIN_CLIENTS, _new_admin_client, creds, token)
+
+
+def _new_data_client_pool(credentials: Credentials) -> List[BetaAnalyticsDataAsyncClient]:
+    from google.analytics.data_v1beta import BetaAnalyticsDataAsyncClient
+    from google.analytics.data_v1beta.services.beta_analytics_data.transports import (
+        BetaAnalyticsDataGrpcAsyncIOTransport,
+    )
+
+    clients = []
+    for _ in range(_DATA_CHANNEL_POOL_SIZE):
+        channel = BetaAnalyticsDataGrpcAsyncIOTransport.create_channel(
+            credentials=credentials,
+            options=_DATA_CHANNEL_OPTIONS,
+        )
+        transport = BetaAnalyticsDataGrpcAsyncIOTransport(channel=channel)
+        clients.append(BetaAnalyticsDataAsyncClient(transport=transport))
+    return clients
+
+
+def _get_data_client(creds: Credentials, token: str) -> BetaAnalyticsDataAsyncClient:
+    # Round-robin over the token's channel pool.
+    return _cached_client(_DATA_CLIENTS, _new_data_client_pool, creds, token)
+
+
+def _new_rest_data_client(credentials: Credentials) -> List[BetaAnalyticsDataClient]:
+    from google.analytics.data_v1beta import BetaAnalyticsDataClient
+
+    return [BetaAnalyticsDataClient(credentials=credentials, transport="rest")]
+
+
+def _get_rest_data_client(creds: Credentials, token: str) -> BetaAnalyticsDataClient:
+    with _REST_DATA_CLIENTS_LOCK:
+        return _cached_client(_REST_DATA_CLIENTS, _new_rest_data_client, creds, token)
+
+
+# ----------------------------
+# Account list cache
+# ----------------------------
+# The account list rarely changes between dashboard page loads, so the
+# serialised response and its ETag are kept per token for a few minutes and a
+# cache hit skips both the Admin API call and serialisation. The cache is
+# shared by the request threads, hence the lock.
+_ACCOUNTS_CACHE: TTLCache = TTLCache(maxsize=1024, ttl=300)
+_ACCOUNTS_CACHE_LOCK = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    # A forked child inherits the parent's loop object, cached channels and
+    # locks, but not the loop thread, nor any guarantee the locks are free.
+    # Start from scratch; the parent's clients are dropped without closing,
+    # their sockets belong to the parent.
+    global _LOOP, _LOOP_LOCK, _REPORT_SEMAPHORE
+    global _ADMIN_CLIENTS, _DATA_CLIENTS, _REST_DATA_CLIENTS, _REST_DATA_CLIENTS_LOCK
+    global _ACCOUNTS_CACHE_LOCK
+    _LOOP = None
+    _LOOP_LOCK = threading.Lock()
+    _REPORT_SEMAPHORE = None
+    _ADMIN_CLIENTS = _ClientCache()
+    _DATA_CLIENTS = _ClientCache()
+    _REST_DATA_CLIENTS = _ClientCache()
+    _REST_DATA_CLIENTS_LOCK = threading.Lock()
+    _ACCOUNTS_CACHE_LOCK = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# ----------------------------
+# GA API calls
+# ----------------------------
+def _account_entry(summary) -> dict:
+    return {
+        "account": summary.account,
+        "displayName": summary.display_name,
+        "properties": [
+            {
+                "property": prop_summary.property,
+                "propertyId": prop_summary.property.rpartition("/")[2],
+                "displayName": prop_summary.display_name,
+            }
+            for prop_summary in summary.property_summaries
+        ],
+    }
+
+
+async def _next_page(pages):
+    try:
+        return await pages.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+async def _first_accounts_page(creds: Credentials, token: str):
+    client = _get_admin_client(creds, token)
+    pager = await client.list_account_summaries()
+    pages = pager.pages
+    return pages, await _next_page(pages)
+
+
+def _stream_accounts(pages, page, cache_key: str):
+    # Emits {"accounts": [...]} one page at a time, so the client starts
+    # receiving data after the first GA page instead of after the last one.
+    # An error on a later page can only truncate the body at this point.
+    chunks = [b'{"accounts":[']
+    yield chunks[0]
+    separator = b""
+    while page is not None:
+        for summary in page.account_summaries:
+            chunk = separator + orjson.dumps(_account_entry(summary))
+            chunks.append(chunk)
+            yield chunk
+            separator = b","
+        page = _run(_next_page(pages))
+    chunks.append(b"]}")
+    yield chunks[-1]
+
+    body = b"".join(chunks)
+    etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+    with _ACCOUNTS_CACHE_LOCK:
+        _ACCOUNTS_CACHE[cache_key] = (body, etag)
+
+
+@functools.lru_cache(maxsize=None)
+def _report_template(metric: str):
+    from google.analytics.data_v1beta.types import RunReportRequest
+
+    # Raw protobuf message: only the property and date range change per call.
+    return RunReportRequest.pb(RunReportRequest(metrics=[{"name": metric}]))
+
+
+def _report_request(
+    property_id: str, metric: str, start_date: str, end_date: str
+) -> RunReportRequest:
+    from google.analytics.data_v1beta.types import RunReportRequest
+
+    # CopyFrom clones the pre-built metrics in C instead of re-walking the
+    # descriptors to build them from dicts on every request.
+    template = _report_template(metric)
+    request_pb = type(template)()
+    request_pb.CopyFrom(template)
+    request_pb.property = f"properties/{property_id}"
+    request_pb.date_ranges.add(start_date=start_date, end_date=end_date)
+    return RunReportRequest.wrap(request_pb)
+
+
+def _metric_total(response) -> int:
+    # When no dimension is requested, GA4 returns a single row with the total.
+    if not response.rows:
+        return 0
+    return int(response.rows[0].metric_values[0].value)
+
+
+def _property_result(response, metric: str) -> dict:
+    if isinstance(response, Exception):
+        return {"error": str(response)}
+    return {"metrics": {metric: _metric_total(response)}}
+
+
+async def _run_report(creds: Credentials, token: str, request_body: RunReportRequest):
+    data_client = _get_data_client(creds, token)
+    return await data_client.run_report(request_body)
+
+
+def _report_semaphore() -> asyncio.Semaphore:
+    # Created on first use from a coroutine, so it belongs to the shared loop;
+    # only coroutines on that loop touch it, so no lock is needed.
+    global _REPORT_SEMAPHORE
+    if _REPORT_SEMAPHORE is None:
+        _REPORT_SEMAPHORE = asyncio.Semaphore(_MAX_CONCURRENT_REPORTS)
+    return _REPORT_SEMAPHORE
+
+
+async def _bounded_run_report(creds: Credentials, token: str, request_body: RunReportRequest):
+    async with _report_semaphore():
+        return await _run_report(creds, token, request_body)
+
+
+async def _run_reports(creds: Credentials, token: str, request_bodies: list) -> list:
+    # GA4's batchRunReports only batches reports for one property, so
+    # multi-property requests fan out as concurrent run_report calls over the
+    # pooled channels instead. Failures are returned in place of the response
+    # so one bad property does not fail the whole request.
+    tasks = [
+        asyncio.create_task(_bounded_run_report(creds, token, body))
+        for body in request_bodies
+    ]
+    return await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# ============================
+# Entry points used by the HTTP handlers in main.py
+# ============================
+def list_accounts(
+    creds: Credentials, token: str
+) -> Tuple[Union[bytes, Iterator[bytes]], Optional[str]]:
+    """
+    Returns the {"accounts": [...]} JSON body for the token's user and its
+    ETag. A cached body comes back as bytes with its ETag; otherwise the body
+    is a generator streaming it page by page and the ETag is None until that
+    body has been cached.
+    """
+    cache_key = _token_key(token)
+    with _ACCOUNTS_CACHE_LOCK:
+        cached = _ACCOUNTS_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+
+    _import_admin_api()
+    pages, first_page = _run(_first_accounts_page(creds, token))
+    return _stream_accounts(pages, first_page, cache_key), None
+
+
+def property_metric(
+    creds: Credentials,
+    token: str,
+    metric: str,
+    property_id: Optional[str],
+    property_ids: Optional[List[str]],
+    start_date: str,
+    end_date: str,
+) -> dict:
+    """
+    Returns the total of `metric` for one property, or for each of
+    `property_ids` keyed by property id when that list is given.
+    """
+    date_range = {"start_date": start_date, "end_date": end_date}
+
+    if property_ids:
+        request_bodies = [
+            _report_request(pid, metric, start_date, end_date) for pid in property_ids
+        ]
+        _import_data_api()
+        responses = _run(_run_reports(creds, token, request_bodies))
+        return {
+            "dateRange": date_range,
+            "properties": {
+                pid: _property_result(response, metric)
+                for pid, response in zip(property_ids, responses)
+            },
+        }
+
+    request_body = _report_request(property_id, metric, start_date, end_date)
+    response = _get_rest_data_client(creds, token).run_report(request_body)
+    return {
+        "propertyId": property_id,
+        "dateRange": date_range,
+        "metrics": {metric: _metric_total(response)},
+    }
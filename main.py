@@ -1,33 +1,65 @@
-import json
-from typing import Tuple
+from __future__ import annotations
+
+import functools
 import traceback
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+import flask
+import orjson
+
+# GA clients, caches and report logic shared by the handlers below.
+import ga4_core
 
-from google.analytics.admin import AnalyticsAdminServiceClient
-from google.analytics.data_v1beta import BetaAnalyticsDataClient
-from google.analytics.data_v1beta.types import RunReportRequest
-from google.oauth2.credentials import Credentials
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
 
 
 # ----------------------------
 # CORS helpers
 # ----------------------------
-def _cors_headers():
-    return {
-        "Content-Type": "application/json",
-        "Access-Control-Allow-Origin": "*",
-        "Access-Control-Allow-Headers": "Authorization, Content-Type",
-        "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
-    }
+# Built once; flask.Response copies headers into its own Headers object,
+# so sharing this dict between responses is safe.
+_CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "Authorization, Content-Type, If-None-Match",
+    "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+    "Access-Control-Expose-Headers": "ETag",
+}
+# Only complete, cached account lists may be reused by the browser. A streamed
+# list can still be cut short by an error on a later page.
+_CACHED_ACCOUNTS_HEADERS = {**_CORS_HEADERS, "Cache-Control": "private, max-age=60"}
+_STREAMED_ACCOUNTS_HEADERS = {**_CORS_HEADERS, "Cache-Control": "no-store"}
+
+def _json_response(payload, status: int = 200) -> flask.Response:
+    return flask.Response(
+        orjson.dumps(payload),
+        status=status,
+        headers=_CORS_HEADERS,
+        mimetype="application/json",
+    )
 
 def _handle_preflight(request):
     # Browsers send an OPTIONS preflight for requests with Authorization header.
     if request.method == "OPTIONS":
-        return ("", 204, _cors_headers())
+        return ("", 204, _CORS_HEADERS)
     return None
 
 # ----------------------------
 # Auth helper
 # ----------------------------
+@functools.lru_cache(maxsize=1024)
+def _credentials_for(token: str) -> Credentials:
+    # Repeat requests with the same token share one Credentials object, so
+    # google-auth's per-object state is reused instead of rebuilt each call.
+    from google.oauth2.credentials import Credentials
+
+    # Important: pass scopes hint (helps some libs / debugging)
+    return Credentials(
+        token=token,
+        scopes=["https://www.googleapis.com/auth/analytics.readonly"],
+    )
+
+
 def _get_user_credentials_from_request(request) -> Tuple[Credentials, str]:
     auth_header = request.headers.get("Authorization", "")
     if not auth_header.startswith("Bearer "):
@@ -37,12 +69,7 @@ def _get_user_credentials_from_request(request) -> Tuple[Credentials, str]:
     if not token:
         raise ValueError("Empty bearer token.")
 
-    # Important: pass scopes hint (helps some libs / debugging)
-    creds = Credentials(
-        token=token,
-        scopes=["https://www.googleapis.com/auth/analytics.readonly"],
-    )
-    return creds, token
+    return _credentials_for(token), token
 
 
 # ============================
@@ -51,34 +78,22 @@ def _get_user_credentials_from_request(request) -> Tuple[Credentials, str]:
 def ga4_list_accounts_oauth(request):
     # CORS preflight
     if request.method == "OPTIONS":
-        return ("", 204, _cors_headers())
+        return ("", 204, _CORS_HEADERS)
 
     try:
-        user_creds, _ = _get_user_credentials_from_request(request)
-
-        client = AnalyticsAdminServiceClient(credentials=user_creds)
-        accounts_data = []
-
-        for summary in client.list_account_summaries():
-            account_entry = {
-                "account": summary.account,
-                "displayName": summary.display_name,
-                "properties": [],
-            }
-
-            for prop_summary in summary.property_summaries:
-                prop_id = prop_summary.property.split("/")[-1]
-                account_entry["properties"].append(
-                    {
-                        "property": prop_summary.property,
-                        "propertyId": prop_id,
-                        "displayName": prop_summary.display_name,
-                    }
-                )
+        user_creds, token = _get_user_credentials_from_request(request)
 
-            accounts_data.append(account_entry)
+        body, etag = ga4_core.list_accounts(user_creds, token)
+        headers = _STREAMED_ACCOUNTS_HEADERS
+        if etag is not None:
+            # Only cached bodies have an ETag, so a match is answered without
+            # touching the Admin API. If-None-Match uses weak comparison, so a
+            # W/ tag from a proxy that re-encoded the body still matches.
+            headers = {**_CACHED_ACCOUNTS_HEADERS, "ETag": f'"{etag}"'}
+            if request.if_none_match.contains_weak(etag):
+                return ("", 304, headers)
 
-        return (json.dumps({"accounts": accounts_data}), 200, _cors_headers())
+        return flask.Response(body, headers=headers, mimetype="application/json")
 
     except Exception as e:
         # Return full debug information to the caller (temporary, for testing)
@@ -86,69 +101,102 @@ def ga4_list_accounts_oauth(request):
             "error": str(e),
             "traceback": traceback.format_exc(),
         }
-        return (json.dumps(err), 500, _cors_headers())
+        return _json_response(err, 500)
 
 
 # ============================
-# FUNCTION 2: CONVERSIONS FOR A GIVEN PROPERTY
+# FUNCTIONS 2 + 3: METRIC TOTAL FOR A GIVEN PROPERTY
 # ============================
-def ga4_property_conversions_oauth(request):
-    """
-    HTTP Cloud Function that returns conversions for a given property id.
+# Every id in property_ids becomes its own Data API call.
+_MAX_PROPERTY_IDS = 50
 
-    Required:
-      Header:
-        Authorization: Bearer <ACCESS_TOKEN>  (analytics.readonly)
-      Query/body:
-        property_id (required): e.g. "182279779"
-        start_date (optional): e.g. "30daysAgo" or "2025-12-01"
-        end_date   (optional): e.g. "today" or "2025-12-15"
+
+def _parse_property_ids(value) -> Optional[List[str]]:
+    """
+    Normalises property_ids from the query string ("1,2") or a JSON body
+    (["1", "2"] or [1, 2]) to a list of strings. Raises ValueError for any
+    other shape.
     """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.split(",")
+    elif not isinstance(value, list):
+        raise ValueError("property_ids must be a list or a comma-separated string.")
+
+    property_ids = []
+    for pid in value:
+        if isinstance(pid, bool) or not isinstance(pid, (str, int)):
+            raise ValueError("property_ids must contain only string or integer ids.")
+        pid = str(pid).strip()
+        if pid:
+            property_ids.append(pid)
+
+    if len(property_ids) > _MAX_PROPERTY_IDS:
+        raise ValueError(f"property_ids accepts at most {_MAX_PROPERTY_IDS} ids.")
+    return property_ids or None
+
+
+def _property_metric_response(request, metric: str):
     pre = _handle_preflight(request)
     if pre:
         return pre
 
     try:
-        user_creds, _ = _get_user_credentials_from_request(request)
+        user_creds, token = _get_user_credentials_from_request(request)
     except ValueError as e:
-        return (json.dumps({"error": str(e)}), 401, _cors_headers())
+        return _json_response({"error": str(e)}, 401)
 
     # --- parameters: query string or JSON body ---
-    property_id = request.args.get("property_id") if request.args else None
-    start_date = request.args.get("start_date") if request.args else None
-    end_date = request.args.get("end_date") if request.args else None
+    # The body is only parsed when the query string names no property.
+    params = request.args.to_dict()
+    if not params.get("property_id") and not params.get("property_ids"):
+        # Query string values take precedence over the body.
+        params = {**(request.get_json(silent=True) or {}), **params}
 
-    if not property_id:
-        data = request.get_json(silent=True) or {}
-        property_id = property_id or data.get("property_id")
-        start_date = start_date or data.get("start_date")
-        end_date = end_date or data.get("end_date")
+    property_id = params.get("property_id")
+    start_date = params.get("start_date") or "30daysAgo"
+    end_date = params.get("end_date") or "today"
 
-    if not property_id:
-        return (json.dumps({"error": "Missing required parameter: property_id"}), 400, _cors_headers())
+    try:
+        property_ids = _parse_property_ids(params.get("property_ids"))
+    except ValueError as e:
+        return _json_response({"error": str(e)}, 400)
 
-    start_date = start_date or "30daysAgo"
-    end_date = end_date or "today"
+    if not property_id and not property_ids:
+        return _json_response(
+            {"error": "Missing required parameter: property_id or property_ids"},
+            400,
+        )
 
     # --- GA4 Data API call ---
-    data_client = BetaAnalyticsDataClient(credentials=user_creds)
-
-    request_body = RunReportRequest(
-        property=f"properties/{property_id}",
-        metrics=[{"name": "conversions"}], 
-        date_ranges=[{"start_date": start_date, "end_date": end_date}],
+    result = ga4_core.property_metric(
+        user_creds, token, metric, property_id, property_ids, start_date, end_date
     )
+    return _json_response(result)
 
-    response = data_client.run_report(request_body)
 
-    total_conversions = 0
-    if response.rows:
-        total_conversions = int(response.rows[0].metric_values[0].value)
+def ga4_property_conversions_oauth(request):
+    """
+    HTTP Cloud Function that returns conversions for a given property id.
+
+    Required:
+      Header:
+        Authorization: Bearer <ACCESS_TOKEN>  (analytics.readonly)
+      Query/body:
+        property_id (required unless property_ids is given): e.g. "182279779"
+        property_ids (alternative to property_id): list of up to 50 property ids,
+          comma-separated in the query string, e.g. "182279779,123456789"
+        start_date (optional): e.g. "30daysAgo" or "2025-12-01"
+        end_date   (optional): e.g. "today" or "2025-12-15"
+    """
+    return _property_metric_response(request, "conversions")
 
-    result = {
-        "propertyId": property_id,
-        "dateRange": {"start_date": start_date, "end_date": end_date},
-        "metrics": {"conversions": total_conversions},  
-    }
 
-    return (json.dumps(result), 200, _cors_headers())
+def ga4_property_sessions_oauth(request):
+    """
+    HTTP Cloud Function that returns sessions for a given property id.
+
+    Takes the same header and parameters as ga4_property_conversions_oauth.
+    """
+    return _property_metric_response(request, "sessions")
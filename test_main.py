@@ -0,0 +1,179 @@
+from types import SimpleNamespace
+
+import pytest
+
+flask = pytest.importorskip("flask")
+pytest.importorskip("cachetools")
+pytest.importorskip("orjson")
+
+import ga4_core
+import main
+import orjson
+
+
+def test_parse_property_ids_accepts_integer_ids():
+    assert main._parse_property_ids([182279779, 123456789]) == ["182279779", "123456789"]
+
+
+def test_parse_property_ids_accepts_string_ids():
+    assert main._parse_property_ids(["182279779", " 123456789 "]) == ["182279779", "123456789"]
+    assert main._parse_property_ids("182279779,,123456789") == ["182279779", "123456789"]
+    assert main._parse_property_ids("") is None
+    assert main._parse_property_ids(None) is None
+
+
+@pytest.mark.parametrize("value", [123, {"id": 1}, [1.5], [True], [["1"]]])
+def test_parse_property_ids_rejects_bad_types(value):
+    with pytest.raises(ValueError):
+        main._parse_property_ids(value)
+
+
+def test_parse_property_ids_rejects_too_many_ids():
+    with pytest.raises(ValueError):
+        main._parse_property_ids(list(range(main._MAX_PROPERTY_IDS + 1)))
+
+
+def _summary(account_id, *property_ids):
+    return SimpleNamespace(
+        account=f"accounts/{account_id}",
+        display_name=f"Account {account_id}",
+        property_summaries=[
+            SimpleNamespace(property=f"properties/{pid}", display_name=f"Property {pid}")
+            for pid in property_ids
+        ],
+    )
+
+
+def _page(*summaries):
+    return SimpleNamespace(account_summaries=list(summaries))
+
+
+async def _pages(*pages):
+    for page in pages:
+        yield page
+
+
+@pytest.fixture
+def accounts_cache():
+    ga4_core._ACCOUNTS_CACHE.clear()
+    yield ga4_core._ACCOUNTS_CACHE
+    ga4_core._ACCOUNTS_CACHE.clear()
+
+
+def test_stream_accounts_joins_pages(accounts_cache):
+    pages = _pages(_page(), _page(_summary(2, 20), _summary(3)))
+    body = b"".join(ga4_core._stream_accounts(pages, _page(_summary(1, 10, 11)), "key"))
+
+    assert orjson.loads(body) == {
+        "accounts": [
+            {
+                "account": "accounts/1",
+                "displayName": "Account 1",
+                "properties": [
+                    {"property": "properties/10", "propertyId": "10", "displayName": "Property 10"},
+                    {"property": "properties/11", "propertyId": "11", "displayName": "Property 11"},
+                ],
+            },
+            {
+                "account": "accounts/2",
+                "displayName": "Account 2",
+                "properties": [
+                    {"property": "properties/20", "propertyId": "20", "displayName": "Property 20"},
+                ],
+            },
+            {"account": "accounts/3", "displayName": "Account 3", "properties": []},
+        ]
+    }
+
+
+def test_stream_accounts_handles_empty_first_page(accounts_cache):
+    body = b"".join(ga4_core._stream_accounts(_pages(_page(_summary(1))), _page(), "key"))
+    assert [a["account"] for a in orjson.loads(body)["accounts"]] == ["accounts/1"]
+
+    body = b"".join(ga4_core._stream_accounts(_pages(), None, "key"))
+    assert orjson.loads(body) == {"accounts": []}
+
+
+def test_stream_accounts_caches_body_after_last_chunk(accounts_cache):
+    stream = ga4_core._stream_accounts(_pages(_page(_summary(2))), _page(_summary(1)), "key")
+    chunks = []
+    for chunk in stream:
+        assert "key" not in accounts_cache
+        chunks.append(chunk)
+
+    body, etag = accounts_cache["key"]
+    assert body == b"".join(chunks)
+    assert etag
+
+
+@pytest.fixture
+def fake_admin_api(monkeypatch, accounts_cache):
+    calls = []
+
+    async def first_accounts_page(creds, token):
+        calls.append(token)
+        return _pages(_page(_summary(2, 20))), _page(_summary(1, 10))
+
+    monkeypatch.setattr(main, "_get_user_credentials_from_request", lambda request: (None, "tok"))
+    monkeypatch.setattr(ga4_core, "_import_admin_api", lambda: None)
+    monkeypatch.setattr(ga4_core, "_first_accounts_page", first_accounts_page)
+    return calls
+
+
+def _list_accounts(headers=None):
+    with flask.Flask(__name__).test_request_context("/", headers=headers or {}):
+        return main.ga4_list_accounts_oauth(flask.request)
+
+
+def test_list_accounts_streams_then_serves_from_cache(fake_admin_api):
+    streamed = _list_accounts()
+    assert streamed.status_code == 200
+    assert streamed.headers["Cache-Control"] == "no-store"
+    assert "ETag" not in streamed.headers
+    accounts = orjson.loads(streamed.get_data())["accounts"]
+    assert [a["account"] for a in accounts] == ["accounts/1", "accounts/2"]
+
+    cached = _list_accounts()
+    assert cached.status_code == 200
+    assert cached.headers["Cache-Control"] == "private, max-age=60"
+    assert cached.get_data() == streamed.get_data()
+    assert fake_admin_api == ["tok"]
+
+    etag = cached.headers["ETag"]
+    body, status, headers = _list_accounts({"If-None-Match": etag})
+    assert (body, status, headers["ETag"]) == ("", 304, etag)
+
+    body, status, _ = _list_accounts({"If-None-Match": f"W/{etag}"})
+    assert status == 304
+
+    assert _list_accounts({"If-None-Match": '"other"'}).status_code == 200
+    assert fake_admin_api == ["tok"]
+
+
+def test_client_cache_closes_each_dropped_entry_once(monkeypatch):
+    closed = []
+    monkeypatch.setattr(ga4_core, "_close_later", closed.append)
+    now = [0]
+    cache = ga4_core._ClientCache(maxsize=2, ttl=10, timer=lambda: now[0])
+
+    def entry(name):
+        clients = [SimpleNamespace(transport=f"{name}-{i}") for i in range(2)]
+        return clients, iter(clients)
+
+    cache["a"] = entry("a")
+    cache["b"] = entry("b")
+    cache["c"] = entry("c")  # evicts "a", the least recently used
+    assert closed == ["a-0", "a-1"]
+
+    now[0] = 5
+    cache["d"] = entry("d")  # evicts "b"
+    now[0] = 12
+    # "c" expires; "d" is still live and the new entry fits without eviction.
+    cache["e"] = entry("e")
+    assert closed == ["a-0", "a-1", "b-0", "b-1", "c-0", "c-1"]
+
+    now[0] = 16
+    # popitem() expires "d" itself before popping "e"; both close once.
+    assert cache.popitem()[0] == "e"
+    assert closed[6:] == ["d-0", "d-1", "e-0", "e-1"]
+    assert len(cache) == 0